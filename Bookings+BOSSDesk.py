@@ -3,29 +3,121 @@ import requests
 import logging
 import certifi
 import sys
+import ssl
 import time
 import json
-import concurrent.futures
-from datetime import datetime
+import itertools
+import functools
+import threading
+import sqlite3
+import queue
+import atexit
+import collections
+import hashlib
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from requests.exceptions import HTTPError, ConnectionError, Timeout, JSONDecodeError
 
+# orjson is optional; the standard library codec is used when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Load environment variables from .env file, before logging is set up so LOG_LEVEL can come from it too
+load_dotenv()
+
 #Implementing logging into script to handle log messages. Writes the logs to a file named integration.log
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler('integration.log'), logging.StreamHandler()])
+# Records go through a queue to a listener thread, so file and console writes never block the HTTP calls
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [logging.FileHandler('integration.log'), logging.StreamHandler()]
+for _log_handler in _log_handlers:
+    _log_handler.setFormatter(_log_formatter)
+
+# Puts an item on a bounded queue without blocking, dropping the oldest waiting item while the queue is full
+def _put_dropping_oldest(bounded_queue, item):
+    while True:
+        try:
+            bounded_queue.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                bounded_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+# Queue handler that drops the oldest waiting record when the queue is full, so a stalled disk cannot grow memory
+class DropOldestQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        _put_dropping_oldest(self.queue, record)
+
+# Queue listener whose stop sentinel also makes room in a full queue, so stopping at exit still flushes and joins
+class DropOldestQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        _put_dropping_oldest(self.queue, self._sentinel)
+
+_log_queue = queue.Queue(maxsize=10_000)
+_log_listener = DropOldestQueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# The queue handler only merges the message arguments; the listener's handlers apply the full format
+_queue_handler = DropOldestQueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+# Defaults to INFO so the pretty-printed appointment and payload dumps are only built when DEBUG is asked for.
+# An unknown LOG_LEVEL falls back to INFO rather than stopping the script at import.
+_log_level_name = (os.getenv('LOG_LEVEL') or 'INFO').strip().upper()
+_log_level = logging.getLevelName(_log_level_name)
+logging.basicConfig(level=_log_level if isinstance(_log_level, int) else logging.INFO, handlers=[_queue_handler])
 logger = logging.getLogger(__name__)
+if not isinstance(_log_level, int):
+    logger.warning("Invalid LOG_LEVEL %r, using INFO", _log_level_name)
 
-# Load environment variables from .env file
-load_dotenv()
+# Decodes a JSON response body straight from its bytes, with orjson when available.
+# Decode errors are raised as requests' JSONDecodeError, like response.json() does.
+def _loads(response):
+    try:
+        return orjson.loads(response.content) if orjson else json.loads(response.content)
+    except json.JSONDecodeError as e:
+        raise JSONDecodeError(e.msg, e.doc, e.pos)
+
+# Encodes a request payload to JSON bytes, with orjson when available
+def _dumps(payload):
+    return orjson.dumps(payload) if orjson else json.dumps(payload).encode()
+
+# Pretty-prints a payload for debug logging, with orjson when available
+def _pretty(payload):
+    return orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode() if orjson else json.dumps(payload, indent=2)
+
+# Cached Graph access token and the monotonic time at which it should be refreshed
+_TOKEN_CACHE = {"value": None, "exp": 0}
+_TOKEN_LOCK = threading.Lock()
 
 # Retrieves token and refreshes when token expires (will be replaced in prod once client cert is implemented)
 def get_token():
-    url = os.environ.get('TOKEN_URL')
+    # Only one thread refreshes the token; the others wait and reuse it
+    with _TOKEN_LOCK:
+        if _TOKEN_CACHE["value"] and time.monotonic() < _TOKEN_CACHE["exp"]:
+            return _TOKEN_CACHE["value"]
+        return fetch_token()
+
+# Drops the cached token so the next get_token call fetches a new one
+def invalidate_token():
+    with _TOKEN_LOCK:
+        _TOKEN_CACHE["value"] = None
+        _TOKEN_CACHE["exp"] = 0
+
+# Requests a new token from Azure AD and caches it; callers hold _TOKEN_LOCK
+def fetch_token():
+    url = CONFIG.token_url
     payload = {
-        'client_id': os.environ.get('CLIENT_ID'),
-        'client_secret': os.environ.get('CLIENT_SECRET'),
+        'client_id': CONFIG.client_id,
+        'client_secret': CONFIG.client_secret,
         'scope': 'https://graph.microsoft.com/.default',
         'grant_type': 'client_credentials'
     } 
@@ -33,327 +125,993 @@ def get_token():
         'Content-Type': 'application/x-www-form-urlencoded'
     }
     try:
-        response = requests.post(url, headers=headers, data=payload)
+        response = SESSION_GRAPH.post(url, headers=headers, data=payload, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # This will raise an exception for HTTP errors
-        token_response = response.json()
-        return token_response.get('access_token')
+        token_response = _loads(response)
+        access_token = token_response.get('access_token')
+        # Refresh a minute before the token actually expires
+        _TOKEN_CACHE["value"] = access_token
+        _TOKEN_CACHE["exp"] = time.monotonic() + int(token_response.get('expires_in', 0)) - 60
+        return access_token
     except requests.RequestException as e:
-        logger.error(f"Error getting token: {e}")
+        logger.error("Error getting token: %s", e)
         return None  
 
 
-# Constants from .env or directly from the environment
-MICROSOFT_GRAPH_API_ENDPOINT = os.environ.get('MICROSOFT_GRAPH_API_ENDPOINT')
-if not MICROSOFT_GRAPH_API_ENDPOINT:
-    logger.error("MICROSOFT_GRAPH_API_ENDPOINT not set")
-    sys.exit(1)
-BOSSDESK_API_ENDPOINT = os.environ.get('BOSSDESK_API_ENDPOINT')
-if not BOSSDESK_API_ENDPOINT:
-    logger.error("BOSSDESK_API_ENDPOINT not set")
-    sys.exit(1)
-BOSSDESK_API_KEY = os.environ.get('BOSSDESK_API_KEY')
-if not BOSSDESK_API_KEY:
-    logger.error("BOSSDESK_API_KEY not set")
+# Connection settings from .env or directly from the environment, with the request URLs built once
+@dataclass(frozen=True, slots=True)
+class Config:
+    graph_endpoint: str
+    bossdesk_endpoint: str
+    bossdesk_api_key: str
+    business_id: str
+    token_url: str
+    client_id: str
+    client_secret: str
+    graph_appointments_url: str
+    graph_batch_url: str
+    bossdesk_tickets_url: str
+    bossdesk_users_url: str
+    appointment_lookback_hours: int
+
+    @classmethod
+    def from_env(cls):
+        for name in ('MICROSOFT_GRAPH_API_ENDPOINT', 'BOSSDESK_API_ENDPOINT', 'BOSSDESK_API_KEY'):
+            if not os.environ.get(name):
+                raise ValueError(f"{name} not set")
+
+        try:
+            appointment_lookback_hours = int(os.environ.get('APPOINTMENT_LOOKBACK_HOURS', '1'))
+        except ValueError:
+            appointment_lookback_hours = -1
+        if appointment_lookback_hours < 0:
+            raise ValueError("APPOINTMENT_LOOKBACK_HOURS must be a whole number of hours, 0 or more")
+
+        graph_endpoint = os.environ['MICROSOFT_GRAPH_API_ENDPOINT']
+        bossdesk_endpoint = os.environ['BOSSDESK_API_ENDPOINT']
+        business_id = os.environ.get('MICROSOFT_BOOKINGS_BUSINESS_ID')
+        return cls(
+            graph_endpoint=graph_endpoint,
+            bossdesk_endpoint=bossdesk_endpoint,
+            bossdesk_api_key=os.environ['BOSSDESK_API_KEY'],
+            business_id=business_id,
+            token_url=os.environ.get('TOKEN_URL'),
+            client_id=os.environ.get('CLIENT_ID'),
+            client_secret=os.environ.get('CLIENT_SECRET'),
+            graph_appointments_url=f"{graph_endpoint}/solutions/bookingBusinesses/{business_id}/appointments",
+            graph_batch_url=f"{graph_endpoint}/$batch",
+            bossdesk_tickets_url=f"{bossdesk_endpoint}/tickets",
+            bossdesk_users_url=f"{bossdesk_endpoint}/users",
+            appointment_lookback_hours=appointment_lookback_hours
+        )
+
+
+try:
+    CONFIG = Config.from_env()
+except ValueError as e:
+    logger.error(str(e))
     sys.exit(1)
 
+# TLS context built once from the certifi bundle and shared by every pooled connection
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
 
+# Optional CA bundle for BOSSDesk, for deployments where its certificate is issued by a private CA
+BOSSDESK_CA_BUNDLE = os.getenv('BOSSDESK_CA_BUNDLE')
 
-def get_ticket_details(ticket_id, headers):
-    try:
-        ticket_detail_url = f"{BOSSDESK_API_ENDPOINT}/tickets/{ticket_id}"
-        response = requests.get(ticket_detail_url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        logger.error(f"Error fetching ticket {ticket_id}: {e}")
-        return None
+# HTTPAdapter that hands one prebuilt SSL context to its connection pools instead of letting each pool build its own
+class SSLContextAdapter(HTTPAdapter):
+    def __init__(self, ssl_context=SSL_CONTEXT, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
 
-# Function to get existing tickets from BOSSDesk
-def get_existing_tickets():
-    headers = {
-        'Authorization': f'Bearer {BOSSDESK_API_KEY}',
-        'Content-Type': 'application/json'
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+    # The context already trusts the right CAs, so keep requests from having urllib3 load a bundle into it per connection
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if verify is True:
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+# Builds a session whose pooled TCP/TLS connections are reused across calls, retrying on throttling and server errors.
+# ca_bundle replaces the certifi bundle for hosts whose certificates it does not cover.
+# verify stays True: a path there would make urllib3 reload the bundle into the shared context for every new connection.
+def build_session(retry_methods, ca_bundle=None):
+    session = requests.Session()
+    ssl_context = ssl.create_default_context(cafile=ca_bundle) if ca_bundle else SSL_CONTEXT
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=retry_methods)
+    session.mount('https://', SSLContextAdapter(ssl_context, pool_connections=4, pool_maxsize=16, max_retries=retries))
+    return session
+
+# One session per host. The Graph session also retries POSTs, since the token and $batch calls are safe to repeat;
+# BOSSDesk POSTs create tickets and are never retried.
+SESSION_GRAPH = build_session(['GET', 'POST'])
+SESSION_BOSS = build_session(['GET'], BOSSDESK_CA_BUNDLE)
+SESSION_BOSS.headers.update({
+    'Authorization': f'Bearer {CONFIG.bossdesk_api_key}',
+    'Content-Type': 'application/json'
+})
+
+# (connect, read) timeout in seconds for every HTTP call, so a hung connection cannot stall the loop
+REQUEST_TIMEOUT = (5, 15)
+
+
+# Validators and parsed bodies of earlier GET responses, keyed by full request URL
+_CONDITIONAL_CACHE = {}
+_CONDITIONAL_CACHE_SIZE = 64
+_CONDITIONAL_CACHE_LOCK = threading.Lock()
+
+# GETs a URL with the validators from its last response, returning the cached body when the server answers 304 Not Modified
+# or sends back the same bytes as last time. transform, if given, is applied to the decoded body before it is cached and returned.
+def conditional_get(session, url, headers=None, params=None, transform=None, **kwargs):
+    key = requests.Request('GET', url, params=params).prepare().url
+    with _CONDITIONAL_CACHE_LOCK:
+        cached = _CONDITIONAL_CACHE.get(key)
+
+    request_headers = dict(headers or {})
+    if cached:
+        if cached['etag']:
+            request_headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            request_headers['If-Modified-Since'] = cached['last_modified']
+
+    response = session.get(url, headers=request_headers, params=params, **kwargs)
+    if response.status_code == 304 and cached:
+        return cached['body']
+    response.raise_for_status()
+
+    # Servers that send no validators often return identical bodies, which are recognised by digest and not decoded again
+    digest = hashlib.blake2b(response.content, digest_size=16).digest()
+    if cached and cached['digest'] == digest:
+        body = cached['body']
+    else:
+        body = _loads(response)
+        if transform:
+            body = transform(body)
+
+    with _CONDITIONAL_CACHE_LOCK:
+        _CONDITIONAL_CACHE.pop(key, None)
+        if len(_CONDITIONAL_CACHE) >= _CONDITIONAL_CACHE_SIZE:
+            _CONDITIONAL_CACHE.pop(next(iter(_CONDITIONAL_CACHE)))
+        _CONDITIONAL_CACHE[key] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'digest': digest,
+            'body': body
+        }
+    return body
+
+
+# Number of tickets requested per page when listing tickets from BOSSDesk
+TICKETS_PER_PAGE = 200
+
+# Number of ticket listing pages fetched in parallel from BOSSDesk, kept low to stay under its rate limit
+MAX_TICKET_PAGE_WORKERS = int(os.getenv('MAX_PAGE_WORKERS', '5'))
+
+# When set, only tickets created within this many days are checked for duplicates instead of the whole history
+TICKET_LOOKBACK_DAYS = os.getenv('TICKET_LOOKBACK_DAYS')
+
+
+# Reduces a page of tickets to its size and the booking IDs it holds, so the ticket dicts can be dropped right away
+def extract_page_booking_ids(tickets):
+    booking_ids = frozenset(filter(None, (ticket.get('custom_fields', {}).get('75') for ticket in tickets)))
+    return len(tickets), booking_ids
+
+# Fetches one page of the ticket listing, asking BOSSDesk for only the fields needed for de-duplication.
+# Returns the number of tickets on the page and their booking IDs.
+def get_ticket_page(page, created_since=None, updated_since=None):
+    query_params = {
+        'q[title_eq]': 'IT support',
+        'per_page': TICKETS_PER_PAGE,
+        'page': page,
+        'fields': 'id,custom_fields'
     }
-    
-    filter_url = f"{BOSSDESK_API_ENDPOINT}/tickets?q[title_eq]=IT%20support"
+    if created_since:
+        query_params['q[created_at_gteq]'] = created_since
+    if updated_since:
+        query_params['q[updated_at_gteq]'] = updated_since
+    return conditional_get(SESSION_BOSS, CONFIG.bossdesk_tickets_url, params=query_params,
+                           transform=extract_page_booking_ids, timeout=REQUEST_TIMEOUT)
+
+# Yields the booking IDs of the ticket listing one page at a time, fetching pages in small parallel batches
+# until one comes back short, so no more than a batch of pages is held at once
+def iter_ticket_pages(get_page):
+    page = 1
+    workers = MAX_TICKET_PAGE_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for ticket_count, booking_ids in executor.map(get_page, range(page, page + workers)):
+                yield booking_ids
+                if ticket_count < TICKETS_PER_PAGE:
+                    return
+            page += workers
+
+# Function to get existing tickets from BOSSDesk, returned as a frozenset of booking IDs, or None if the listing failed.
+# With updated_since, only tickets created or changed since that time are listed.
+def get_existing_tickets(updated_since=None):
     try:
-        filter_response = requests.get(filter_url, headers=headers, verify=False)
-        filter_response.raise_for_status()
-        filtered_tickets = filter_response.json()
+        # Day granularity keeps the page URLs stable between polls so conditional GETs still match
+        created_since = None
+        if TICKET_LOOKBACK_DAYS and not updated_since:
+            created_since = (datetime.now(timezone.utc) - timedelta(days=int(TICKET_LOOKBACK_DAYS))).strftime('%Y-%m-%d')
+        get_page = functools.partial(get_ticket_page, created_since=created_since, updated_since=updated_since)
 
         existing_appointment_ids = set()
+        for booking_ids in iter_ticket_pages(get_page):
+            existing_appointment_ids.update(booking_ids)
+        return frozenset(existing_appointment_ids)
+
+    except requests.RequestException as e:
+        logger.error("Error fetching and processing tickets: %s", e)
+        return None
+
+
+# Local record of appointments that already have a ticket, so most iterations and restarts need no BOSSDesk listing
+SEEN_DB_PATH = os.getenv('SEEN_DB_PATH', 'seen.db')
+
+# Number of iterations between reconciliations of the local record with the tickets in BOSSDesk
+RECONCILE_EVERY = max(1, int(os.getenv('RECONCILE_EVERY', '12')))
+
+_SEEN_DB = sqlite3.connect(SEEN_DB_PATH, check_same_thread=False)
+_SEEN_DB.execute('CREATE TABLE IF NOT EXISTS seen(appt_id TEXT PRIMARY KEY)')
+_SEEN_DB.execute('CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT)')
+_SEEN_DB.execute('CREATE TABLE IF NOT EXISTS pending(appt_id TEXT PRIMARY KEY, appointment TEXT)')
+_SEEN_DB_LOCK = threading.Lock()
+SEEN_APPOINTMENT_IDS = {row[0] for row in _SEEN_DB.execute('SELECT appt_id FROM seen')}
+
+# Records appointments as having a ticket, both in memory and in the local database
+def record_seen_appointment_ids(appointment_ids):
+    with _SEEN_DB_LOCK:
+        new_ids = [appointment_id for appointment_id in appointment_ids if appointment_id not in SEEN_APPOINTMENT_IDS]
+        if not new_ids:
+            return
+        try:
+            with _SEEN_DB:
+                _SEEN_DB.executemany('INSERT OR IGNORE INTO seen(appt_id) VALUES (?)', ((appointment_id,) for appointment_id in new_ids))
+                _SEEN_DB.executemany('DELETE FROM pending WHERE appt_id = ?', ((appointment_id,) for appointment_id in new_ids))
+        except sqlite3.Error as e:
+            logger.error("Error recording seen appointments: %s", e)
+        SEEN_APPOINTMENT_IDS.update(new_ids)
+
+# Keeps appointments whose ticket could not be created, so they are retried even after the delta sync has moved past them
+def save_pending_appointments(appointments):
+    with _SEEN_DB_LOCK:
+        appointments = [appointment for appointment in appointments if appointment['id'] not in SEEN_APPOINTMENT_IDS]
+        if not appointments:
+            return
+        try:
+            with _SEEN_DB:
+                _SEEN_DB.executemany('INSERT OR REPLACE INTO pending(appt_id, appointment) VALUES (?, ?)',
+                                     ((appointment['id'], _dumps(appointment).decode()) for appointment in appointments))
+        except sqlite3.Error as e:
+            logger.error("Error recording pending appointments: %s", e)
+
+# Appointments still waiting for a ticket from earlier iterations
+def load_pending_appointments():
+    with _SEEN_DB_LOCK:
+        rows = _SEEN_DB.execute('SELECT appointment FROM pending').fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+# Tickets changed this long before the last reconciliation are listed again, to cover clock skew and indexing delays
+RECONCILE_OVERLAP = timedelta(minutes=5)
+
+# Reads a timestamp kept in the local database, or None if it was never recorded
+def load_meta_time(key):
+    with _SEEN_DB_LOCK:
+        row = _SEEN_DB.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+def save_meta_time(key, value):
+    with _SEEN_DB_LOCK:
+        try:
+            with _SEEN_DB:
+                _SEEN_DB.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value.isoformat()))
+        except sqlite3.Error as e:
+            logger.error("Error recording %s: %s", key, e)
+
+# Time of the last successful reconciliation, or None if the local record has never been reconciled with BOSSDesk
+def load_last_reconciled():
+    return load_meta_time('last_reconciled')
+
+# Brings the local record up to date with BOSSDesk. After the first full listing, only tickets changed since the
+# previous reconciliation are fetched; the time of the last one is kept in the local database across restarts.
+def reconcile_seen_appointments():
+    started = datetime.now(timezone.utc)
+    last_reconciled = load_last_reconciled()
+    updated_since = None
+    if last_reconciled:
+        updated_since = (last_reconciled - RECONCILE_OVERLAP).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    appointment_ids = get_existing_tickets(updated_since)
+    if appointment_ids is None:
+        return False
+    record_seen_appointment_ids(appointment_ids)
+    save_meta_time('last_reconciled', started)
+    return True
+
+
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = [executor.submit(get_ticket_details, ticket['id'], headers) for ticket in filtered_tickets]
-            for future in concurrent.futures.as_completed(futures):
-                ticket_details = future.result()
-                if ticket_details:
-                    booking_id = ticket_details.get('custom_fields', {}).get('75')
-                    if booking_id:
-                        existing_appointment_ids.add(booking_id)
+# Maximum number of sub-requests Microsoft Graph accepts in a single JSON batch
+GRAPH_BATCH_SIZE = 20
 
-        return existing_appointment_ids
 
+# Sends requests to Microsoft Graph through the $batch endpoint, 20 at a time, and returns the responses keyed by request id
+def graph_batch(requests_list, headers):
+    batch_url = CONFIG.graph_batch_url
+    batch_headers = {**headers, 'Content-Type': 'application/json'}
+
+    responses = {}
+    pending = iter(requests_list)
+    while True:
+        chunk = list(itertools.islice(pending, GRAPH_BATCH_SIZE))
+        if not chunk:
+            break
+        response = SESSION_GRAPH.post(batch_url, headers=batch_headers, data=_dumps({'requests': chunk}), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        for sub_response in _loads(response).get('responses', []):
+            responses[sub_response.get('id')] = sub_response
+    return responses
+
+# Fetches the full details of appointments listed without customer data, using batched Graph calls
+def expand_appointments(appointments, business_id, headers):
+    batch_requests = [
+        {
+            'id': str(index),
+            'method': 'GET',
+            'url': f"/solutions/bookingBusinesses/{business_id}/appointments/{appointment['id']}"
+        }
+        for index, appointment in enumerate(appointments) if not appointment.get('customers')
+    ]
+    if not batch_requests:
+        return appointments
+
+    try:
+        responses = graph_batch(batch_requests, headers)
     except requests.RequestException as e:
-        logger.error(f"Error fetching and processing tickets: {e}")
-        return set()
+        logger.error("Error expanding appointment details: %s", e)
+        return appointments
 
+    for request_id, sub_response in responses.items():
+        index = int(request_id)
+        if sub_response.get('status') == 200:
+            appointments[index] = sub_response.get('body', appointments[index])
+        else:
+            logger.warning("Could not expand appointment %s: status %s", appointments[index].get('id'), sub_response.get('status'))
+    return appointments
 
 
-# Function to get new appointments from Microsoft Graph
-def get_new_appointments():
+# File holding the Graph deltaLink of the last completed iteration
+DELTA_TOKEN_FILE = '.delta_token'
+
+# Whether Graph supports delta queries on the appointments collection; None until the first attempt tells us
+DELTA_QUERY_SUPPORTED = None
+
+# deltaLink returned by the latest poll, persisted only once its appointments have been processed
+_pending_delta_link = None
+
+
+def load_delta_link():
     try:
-        # Get the token
-        token = get_token()
-        if not token:
-            logger.error("Failed to get token")
-            return []
+        with open(DELTA_TOKEN_FILE) as delta_file:
+            return delta_file.read().strip() or None
+    except FileNotFoundError:
+        return None
 
-        # Set up the headers for the request to Microsoft Graph API
-        headers = {'Authorization': f'Bearer {token}'}
+# Persists the deltaLink of the latest poll so the next one starts from there
+def save_delta_link():
+    if not _pending_delta_link:
+        return
+    try:
+        with open(DELTA_TOKEN_FILE, 'w') as delta_file:
+            delta_file.write(_pending_delta_link)
+    except OSError as e:
+        logger.error("Error saving delta link: %s", e)
 
-        # Get the business ID from the environment
-        business_id = os.environ.get('MICROSOFT_BOOKINGS_BUSINESS_ID')
+# Follows the appointments delta query from the saved deltaLink; returns None if Graph does not support it
+def get_appointment_changes(url, headers):
+    global DELTA_QUERY_SUPPORTED, _pending_delta_link
+
+    next_url = load_delta_link() or f"{url}/delta"
+    appointments = []
+    while next_url:
+        response = SESSION_GRAPH.get(next_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if DELTA_QUERY_SUPPORTED is None and response.status_code in (400, 404, 501):
+            logger.info("Delta queries are not supported for appointments, polling the full collection")
+            DELTA_QUERY_SUPPORTED = False
+            return None
+        if response.status_code == 410:
+            # The saved sync state has expired, so start a fresh delta round
+            logger.warning("Saved delta link expired, restarting appointment sync")
+            next_url = f"{url}/delta"
+            appointments = []
+            continue
+        response.raise_for_status()
+        DELTA_QUERY_SUPPORTED = True
 
-        # Define the URL to get appointments
-        url = f"{MICROSOFT_GRAPH_API_ENDPOINT}/solutions/bookingBusinesses/{business_id}/appointments"
+        page = _loads(response)
+        appointments.extend(appointment for appointment in page.get('value', []) if '@removed' not in appointment)
+        next_url = page.get('@odata.nextLink')
+        _pending_delta_link = page.get('@odata.deltaLink', _pending_delta_link)
+    return appointments
 
-        # Send the request and get the response
-        response = requests.get(url, headers=headers, verify=False)
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
 
-        logger.debug(f"Raw response from BOSSDesk API: {response.json()}")
+# Page size requested from Graph when polling the full appointments collection
+APPOINTMENT_PAGE_SIZE = 100
+
+# Appointment properties read when mapping an appointment to a service request
+APPOINTMENT_FIELDS = 'id,serviceName,serviceNotes,customers,staffMemberIds,startDateTime'
+
+# Start time of the latest full-collection poll, persisted only once its appointments have been processed
+_pending_poll_time = None
+
+# Lists recent and upcoming appointments page by page, letting Graph do the filtering instead of returning the whole history.
+# The cutoff reaches back to the last processed poll, so appointments that started while the script was down are still listed,
+# and is rounded down to the hour so the request URL, and with it the conditional GET cache, stays stable between polls.
+def get_upcoming_appointments(url, headers):
+    global _pending_poll_time
+
+    started = datetime.now(timezone.utc)
+    last_polled = load_meta_time('last_polled')
+    since = min(last_polled, started) if last_polled else started
+    cutoff = since.replace(minute=0, second=0, microsecond=0) - timedelta(hours=CONFIG.appointment_lookback_hours)
+    params = {
+        '$select': APPOINTMENT_FIELDS,
+        '$filter': f"startDateTime/dateTime gt '{cutoff.strftime('%Y-%m-%dT%H:%M:%S')}'",
+        '$top': APPOINTMENT_PAGE_SIZE
+    }
+
+    appointments = []
+    next_url = url
+    while next_url:
+        page = conditional_get(SESSION_GRAPH, next_url, headers, params=params, timeout=REQUEST_TIMEOUT)
+        appointments.extend(page.get('value', []))
+        # nextLink already carries the query options
+        next_url = page.get('@odata.nextLink')
+        params = None
+    _pending_poll_time = started
+    return appointments
+
+# Records the start of the latest full-collection poll as processed, so the next cutoff starts from it
+def save_last_polled():
+    if _pending_poll_time:
+        save_meta_time('last_polled', _pending_poll_time)
 
-        appointments = response.json().get('value', [])
 
-        #Log the full details of each appointment
-        for appointment in appointments:
-            logger.info(f"Appointment data: {json.dumps(appointment, indent=2)}")
+# Lists the appointments to process with the given Graph headers, with their full details
+def fetch_appointments(headers):
+    business_id = CONFIG.business_id
+    url = CONFIG.graph_appointments_url
+
+    # Only appointments changed since the last completed iteration are fetched when Graph supports delta queries
+    appointments = None
+    if DELTA_QUERY_SUPPORTED is not False:
+        appointments = get_appointment_changes(url, headers)
+
+    if appointments is None:
+        appointments = get_upcoming_appointments(url, headers)
+    return expand_appointments(appointments, business_id, headers)
+
+
+# Function to get new appointments from Microsoft Graph
+def get_new_appointments():
+    try:
+        # A token revoked before its expiry is dropped and fetched again, once
+        for attempt in range(2):
+            # Get the token
+            token = get_token()
+            if not token:
+                logger.error("Failed to get token")
+                return []
+
+            # Set up the headers for the request to Microsoft Graph API
+            headers = {'Authorization': f'Bearer {token}'}
+            try:
+                appointments = fetch_appointments(headers)
+                break
+            except HTTPError as e:
+                if attempt or e.response is None or e.response.status_code != 401:
+                    raise
+                logger.warning("Microsoft Graph rejected the cached token, requesting a new one")
+                invalidate_token()
+
+        # Log the full details of each appointment, only paying for the pretty-printing when debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            for appointment in appointments:
+                logger.debug("Appointment data: %s", _pretty(appointment))
         
         return appointments
     
     except requests.RequestException as e:
-        logger.error(f"Error getting appointments: {e}")
+        logger.error("Error getting appointments: %s", e)
         return [] # Ensures a list is returned even in case of an exception
 
 
 # Function to create a service request in BOSSDesk
-def create_service_request(appointment):
-    try:
-        # Map appointment details to service request fields
-        service_request = map_appointment_to_service_request(appointment)
+def create_service_request(appointment, requester_ids=None):
+    # Map appointment details to service request fields
+    service_request = map_appointment_to_service_request(appointment, requester_ids)
 
-        # If mapping was unsuccessful, skip creating the service request
-        if not service_request:
-            logger.warning("Failed to map appointment to service request")
-            return
+    # If mapping was unsuccessful, skip creating the service request
+    if not service_request:
+        logger.warning("Failed to map appointment to service request")
+        return False
 
-        # Set up the headers for the request to BOSSDesk API
-        headers = {
-            'Authorization': f'Bearer {BOSSDESK_API_KEY}',
-            'Content-Type': 'application/json'
-        }
+    return post_service_request(service_request)
 
+
+# Number of individual ticket POSTs allowed in flight at once
+BOSSDESK_CONCURRENCY = int(os.getenv('BOSSDESK_CONCURRENCY', '8'))
+
+# Token bucket shared by the threads posting to BOSSDesk, allowing up to rate requests per second with bursts of the same size.
+# The bucket always holds at least one token, so rates below one request per second still let requests through.
+class RateLimiter:
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Blocks until a request may be sent
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Caps ticket creation POSTs per second to stay under BOSSDesk's rate limit
+try:
+    BOSSDESK_MAX_RPS = float(os.getenv('BOSSDESK_MAX_RPS', '10'))
+    if BOSSDESK_MAX_RPS <= 0:
+        raise ValueError("must be greater than 0")
+except ValueError as e:
+    logger.error("Invalid BOSSDESK_MAX_RPS: %s", e)
+    sys.exit(1)
+BOSSDESK_RATE_LIMITER = RateLimiter(BOSSDESK_MAX_RPS)
+
+# Posts a single mapped service request to BOSSDesk and returns whether it was created
+def post_service_request(service_request):
+    try:
         # Define the URL to create the ticket
-        url = f"{BOSSDESK_API_ENDPOINT}/tickets"
+        url = CONFIG.bossdesk_tickets_url
 
-        # Send the request and get the response
-        logger.info(f"Service request payload: {json.dumps(service_request, indent=2)}")
-        response = requests.post(url, headers=headers, data=json.dumps(service_request), verify=False)  # In PROD, remove verify=False
+        # Send the request and get the response, serializing the payload once
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Service request payload: %s", _pretty(service_request))
+        BOSSDESK_RATE_LIMITER.acquire()
+        response = SESSION_BOSS.post(url, data=_dumps(service_request), timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
+        record_seen_appointment_ids([service_request['ticket']['custom_fields']['75']])
 
-        # Log successful service request creation
-        if response.status_code == 201:
-            logger.info(f"Service request created successfully: {response.json().get('id')}")
-        
     except ConnectionError:
         logger.error("Network error occurred while creating service request")
+        return False
     except Timeout:
         logger.error("Request timed out while creating service request")
-    except JSONDecodeError:
-        logger.error("Response JSON decoding failed")
+        return False
     except HTTPError as e:
-        logger.error(f"HTTP error occurred: {e}")
+        logger.error("HTTP error occurred: %s", e)
+        return False
     except requests.RequestException as e:
-        logger.error(f"Error creating service request: {e}")
+        logger.error("Error creating service request: %s", e)
+        return False
+
+    # The ticket exists at this point, so an unreadable response body only costs the log line its ID
+    if response.status_code == 201:
+        try:
+            ticket_id = _loads(response).get('id')
+        except (JSONDecodeError, AttributeError):
+            ticket_id = response.headers.get('Location')
+        logger.info("Service request created successfully: %s", ticket_id)
+    return True
+
+
+# Whether BOSSDesk accepts bulk ticket creation; None until the first attempt tells us
+BULK_CREATE_SUPPORTED = None
 
+# Maximum number of tickets sent in one bulk create request
+BULK_CREATE_BATCH_SIZE = 50
+
+# Creates service requests for several appointments, in one bulk POST when BOSSDesk supports it.
+# Returns the number of tickets created and the IDs of the appointments whose creation failed or may have failed.
+# Appointments that could not be mapped are in neither: their data has to change before a retry can succeed.
+def create_service_requests_bulk(appointments, requester_ids=None):
+    global BULK_CREATE_SUPPORTED
+
+    service_requests = []
+    for appointment in appointments:
+        service_request = map_appointment_to_service_request(appointment, requester_ids)
+        if service_request:
+            service_requests.append(service_request)
+        else:
+            logger.warning("Failed to map appointment %s to a service request", appointment.get('id'))
+    created = 0
+    if not service_requests:
+        return created, set()
+
+    # Batches BOSSDesk rejected as a whole are created one ticket at a time instead
+    individual_requests = []
+    while BULK_CREATE_SUPPORTED is not False and service_requests:
+        batch = service_requests[:BULK_CREATE_BATCH_SIZE]
+        payload = {'tickets': [service_request['ticket'] for service_request in batch]}
+        try:
+            BOSSDESK_RATE_LIMITER.acquire()
+            response = SESSION_BOSS.post(f"{CONFIG.bossdesk_tickets_url}/bulk", data=_dumps(payload), timeout=REQUEST_TIMEOUT)
+            if response.status_code in (404, 405, 501):
+                logger.info("BOSSDesk does not support bulk ticket creation, falling back to individual requests")
+                BULK_CREATE_SUPPORTED = False
+            elif 400 <= response.status_code < 500 and response.status_code not in (401, 403, 429):
+                # A rejected request created nothing, so its tickets can safely be retried one by one
+                logger.warning("BOSSDesk rejected a bulk ticket creation with status %s, creating its tickets individually", response.status_code)
+                individual_requests.extend(batch)
+                service_requests = service_requests[BULK_CREATE_BATCH_SIZE:]
+            else:
+                response.raise_for_status()
+                BULK_CREATE_SUPPORTED = True
+                record_seen_appointment_ids([ticket['custom_fields']['75'] for ticket in payload['tickets']])
+                logger.info("Created %s service requests in one bulk request", len(batch))
+                created += len(batch)
+                service_requests = service_requests[BULK_CREATE_BATCH_SIZE:]
+        except requests.RequestException as e:
+            # The batch may have been partially applied, so leave the rest to the next iteration's reconciliation
+            logger.error("Error creating service requests in bulk: %s", e)
+            return created, {service_request['ticket']['custom_fields']['75'] for service_request in individual_requests + service_requests}
+    service_requests = individual_requests + service_requests
+    if not service_requests:
+        return created, set()
+
+    # Individual POSTs are overlapped on a small pool sharing the session's connections.
+    # post_service_request handles request errors itself, so anything else raised here is a bug and is not swallowed.
+    outcomes = collections.Counter()
+    failed_ids = set()
+    with ThreadPoolExecutor(max_workers=BOSSDESK_CONCURRENCY) as executor:
+        futures = {executor.submit(post_service_request, service_request): service_request['ticket']['custom_fields']['75']
+                   for service_request in service_requests}
+        for future in as_completed(futures):
+            if future.result():
+                outcomes['created'] += 1
+            else:
+                outcomes['failed'] += 1
+                failed_ids.add(futures[future])
+    logger.info("Created %s of %s service requests: %s", outcomes['created'], len(service_requests), dict(outcomes))
+    return created + outcomes['created'], failed_ids
+
+
+# Staff member to agent mapping, parsed once at startup so a malformed value stops the script instead of every mapping
+try:
+    STAFF_ID_AGENT_ID_MAP = json.loads(os.getenv('STAFF_ID_AGENT_ID_MAP', '{}'))
+    if not isinstance(STAFF_ID_AGENT_ID_MAP, dict):
+        raise ValueError("STAFF_ID_AGENT_ID_MAP must be a JSON object")
+except ValueError as e:
+    logger.error("Invalid STAFF_ID_AGENT_ID_MAP: %s", e)
+    sys.exit(1)
 
 def map_staff_id_to_agent_id(staff_id):
-    staff_id_agent_id_map = json.loads(os.getenv('STAFF_ID_AGENT_ID_MAP', '{}'))
-    return staff_id_agent_id_map.get(staff_id, None) # Returns none if mapping is not found. 
+    return STAFF_ID_AGENT_ID_MAP.get(staff_id) # Returns none if mapping is not found. 
+
+# Domain of the employee emails that map to BOSSDesk usernames
+_GMH_DOMAIN = '@gmh.edu'
 
 def extract_username_from_email(email):
-    if email and '@gmh.edu' in email:
+    if isinstance(email, str) and email.lower().endswith(_GMH_DOMAIN):
         return email.split('@')[0]
     else:
         # Log a warning if the email format is invalid or not provided
-        logger.warning(f"Invalid or missing email: {email}")
+        logger.warning("Invalid or missing email: %s", email)
         return None
 
+# Memoizes a single-argument lookup for ttl seconds. Misses (None) are not cached so failed lookups are retried.
+def ttl_cache(ttl, maxsize=1024):
+    def decorator(func):
+        cache = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(key):
+            now = time.monotonic()
+            with lock:
+                entry = cache.get(key)
+            if entry and now < entry[1]:
+                return entry[0]
+
+            value = func(key)
+            if value is not None:
+                with lock:
+                    cache.pop(key, None)
+                    if len(cache) >= maxsize:
+                        cache.pop(next(iter(cache)))
+                    cache[key] = (value, now + ttl)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
 # Searches BOSSDesk for a user by username and returns their friendly_id.   
+@ttl_cache(ttl=3600)
 def find_user_id(username):
     query_params = {'q[username_eq]': username}
-    url = f"{BOSSDESK_API_ENDPOINT}/users"
-
-    headers = {
-        'Authorization': f'Bearer {BOSSDESK_API_KEY}',
-        'Content-Type': 'application/json'
-    }
+    url = CONFIG.bossdesk_users_url
 
     try:
-        response = requests.get(url, headers=headers, params=query_params, verify=False)
+        response = SESSION_BOSS.get(url, params=query_params, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        users = response.json()
+        users = _loads(response)
         if users:
             return users[0].get('friendly_id')
         else:
-            logger.warning(f"No user found for username: {username}")
+            logger.warning("No user found for username: %s", username)
             return None
     except requests.RequestException as e:
-        logger.error(f"Error searching for user by username: {e}")
+        logger.error("Error searching for user by username: %s", e)
         return None
 
 
-
+@ttl_cache(ttl=3600)
 def get_requester_id_by_email(email):
     if not email:
         logger.warning("Email not provided for fetching requester_id")
         return None
 
     try:
-        url = f"{BOSSDESK_API_ENDPOINT}/users?q[email_eq]={email}"
-        headers = {
-            'Authorization': f'Bearer {BOSSDESK_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        response = requests.get(url, headers=headers, verify=False)
+        url = f"{CONFIG.bossdesk_users_url}?q[email_eq]={email}"
+        response = SESSION_BOSS.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        users = response.json()
+        users = _loads(response)
         if users:
             return users[0].get("id")
         else:
-            logger.warning(f"No user found with email: {email}")
+            logger.warning("No user found with email: %s", email)
             return None
     except requests.RequestException as e:
-        logger.error(f"Error fetching requester_id by email: {e}")
+        logger.error("Error fetching requester_id by email: %s", e)
         return None
 
+
+# Maximum number of emails sent in one BOSSDesk user search
+USER_EMAILS_PER_QUERY = 50
+
+# Looks up many users at once by email and returns a dict of lowercased email to friendly_id
+def fetch_users_by_emails(emails):
+    url = CONFIG.bossdesk_users_url
+
+    requester_ids = {}
+    emails = sorted(emails)
+    for start in range(0, len(emails), USER_EMAILS_PER_QUERY):
+        query_params = [('q[email_in][]', email) for email in emails[start:start + USER_EMAILS_PER_QUERY]]
+        try:
+            response = SESSION_BOSS.get(url, params=query_params, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            for user in _loads(response):
+                if user.get('email') and user.get('friendly_id'):
+                    requester_ids[user['email'].lower()] = user['friendly_id']
+        except requests.RequestException as e:
+            logger.error("Error searching for users by email: %s", e)
+    return requester_ids
+
+# Collects the distinct employee emails answered on a batch of appointments
+def collect_employee_emails(appointments):
+    emails = set()
+    for appointment in appointments:
+        try:
+            email = get_customer_details(appointment)['employee_email']
+        except (KeyError, IndexError, TypeError, AttributeError):
+            continue
+        if email and email != 'Not Provided':
+            emails.add(email.lower())
+    return emails
+
     
-# Function to map appointment details to service request fields
-def map_appointment_to_service_request(appointment):
-    try:
-        # Assuming 'customers' is always present and has at least one customer.
-        customer = appointment['customers'][0]  # Get the first customer
-        custom_questions = customer.get('customQuestionAnswers', [])
-        
-        # Define a dictionary for question ID to variable mappings
-        question_mappings = {
-            os.getenv('EMPLOYEE_NAME_QUESTION_ID'): 'employee_name',
-            os.getenv('EMPLOYEE_EMAIL_QUESTION_ID'): 'employee_email',
-            os.getenv('EMPLOYEE_PHONE_QUESTION_ID'): 'employee_phone',
-            os.getenv('EMPLOYEE_TYPE_QUESTION_ID'): 'employee_type',
-            os.getenv('EMPLOYEE_MANAGER_QUESTION_ID'): 'employee_manager',
-            os.getenv('EMPLOYEE_MANAGER_EMAIL_QUESTION_ID'): 'employee_manager_email'
-        }
+# Question ID to customer detail mappings, built once from the environment
+QUESTION_MAPPINGS = {
+    os.getenv('EMPLOYEE_NAME_QUESTION_ID'): 'employee_name',
+    os.getenv('EMPLOYEE_EMAIL_QUESTION_ID'): 'employee_email',
+    os.getenv('EMPLOYEE_PHONE_QUESTION_ID'): 'employee_phone',
+    os.getenv('EMPLOYEE_TYPE_QUESTION_ID'): 'employee_type',
+    os.getenv('EMPLOYEE_MANAGER_QUESTION_ID'): 'employee_manager',
+    os.getenv('EMPLOYEE_MANAGER_EMAIL_QUESTION_ID'): 'employee_manager_email'
+}
+MAPPED_IDS = frozenset(QUESTION_MAPPINGS)
 
-        # Initialize variables for custom fields
-        customer_details = {key: 'Not Provided' for key in question_mappings.values()}
-
-        # Iterate through custom questions and map answers
-        for question in custom_questions:
-            question_id = question.get('questionId')
-            if question_id in question_mappings:
-                customer_details[question_mappings[question_id]] = question.get('answer', 'Not Provided')
-
-               
-        # Construct the description from appointment details
-        description_parts = [f"<b>{label}</b> {customer_details[key]}" for key, label in {
-            'employee_manager': "Manager Name",
-            'employee_manager_email': "Manager Email",
-            'employee_name': "Name",
-            'employee_phone': "Phone Number",
-            'employee_email': "Email",
-            'employee_type': "Employee Type"
-        }.items()]
-        description_parts.append(f"<h3>Special Instructions</h3><br> {appointment.get('serviceNotes', 'No Additional Notes').split('TeamsMeetingSeparator')[0].strip()}")
-        description = "<br><br>".join(description_parts)
-        
-        # Extract the staff member's email or identifier
-        booking_staff_member = appointment.get('bookingStaffMember')
-        staff_email = booking_staff_member.get('customerEmailAddress') if booking_staff_member else None
+# Customer details used when a question was not answered
+_DEFAULTS = {key: 'Not Provided' for key in QUESTION_MAPPINGS.values()}
 
-        # Extract staff member ID from the appointment
-        staff_member_id = appointment.get('staffMemberIds', [])[0] if appointment.get('staffMemberIds') else None
+# Maps the answers to the employee custom questions of an appointment's first customer
+def get_customer_details(appointment):
+    # Assuming 'customers' is always present and has at least one customer.
+    customer = appointment['customers'][0]  # Get the first customer
+    custom_questions = customer.get('customQuestionAnswers', [])
 
-        if staff_member_id:
-            # Map staff member ID to agent ID in BOSSDesk
-            agent_id = map_staff_id_to_agent_id(staff_member_id)
-        else:
-            logger.warning("No staff member ID found in the appointment")
+    # Initialize variables for custom fields
+    customer_details = _DEFAULTS.copy()
 
-        # Extracting username from employee's email
-        employee_username = extract_username_from_email(customer_details['employee_email'])
+    # Iterate through custom questions and map answers, skipping questions we don't track
+    # and stopping once every tracked question has been answered
+    answered = set()
+    for question in custom_questions:
+        question_id = question.get('questionId')
+        if question_id in MAPPED_IDS and question_id not in answered:
+            customer_details[QUESTION_MAPPINGS[question_id]] = question.get('answer', 'Not Provided')
+            answered.add(question_id)
+            if len(answered) == len(MAPPED_IDS):
+                break
+
+    return customer_details
+
+
+# Fields shared by every service request created from a booking
+_TICKET_TEMPLATE = {
+    'type_id': 99,  # Service Request (#SR) type ID
+    'category_id': 34,  # Ticket category "Technical Support - Hardware - Laptop"
+    'team_id': 48,
+    'priority_id': 4
+}
+
+# HTML description of a service request, filled from the customer details and the appointment notes
+DESCRIPTION_TEMPLATE = (
+    "<b>Manager Name</b> {employee_manager}<br><br>"
+    "<b>Manager Email</b> {employee_manager_email}<br><br>"
+    "<b>Name</b> {employee_name}<br><br>"
+    "<b>Phone Number</b> {employee_phone}<br><br>"
+    "<b>Email</b> {employee_email}<br><br>"
+    "<b>Employee Type</b> {employee_type}<br><br>"
+    "<h3>Special Instructions</h3><br> {notes}"
+)
 
-        # Fetch requester_id based on employee email
-        requester_id = None
-        if employee_username:
-            requester_id = find_user_id(employee_username)
-            if not requester_id:
-                logger.warning(f"Could not find requester_id for username: {employee_username}")
-            else:
-                logger.warning("Employee username could not be extracted from email")
-        
-        # Contructing the service request with the new requester ID
-        service_request = {
-            'ticket': {
-                'title': appointment.get('serviceName'),
-                'description': description,
-                'type_id': 99,  # Service Request (#SR) type ID
-                'category_id': 34,  # Ticket category "Technical Support - Hardware - Laptop"
-                'team_id': 48,
-                'priority_id': 4,
-                'custom_fields': {
-                    '75': appointment.get('id'),  # Microsoft Bookings appointment ID
-                },
-                'agent_id': agent_id,
-                'requester_id': requester_id      
-            }
-        }
-        
 
-    except Exception as e:
-        logger.error(f"Error mapping appointment to service request: {e}")
+# Function to map appointment details to service request fields.
+# requester_ids optionally maps lowercased employee emails to BOSSDesk friendly_ids fetched ahead of time.
+def map_appointment_to_service_request(appointment, requester_ids=None):
+    # An appointment without customer answers cannot be mapped
+    try:
+        customer_details = get_customer_details(appointment)
+    except (KeyError, IndexError, TypeError, AttributeError) as e:
+        logger.error("Error mapping appointment to service request: missing customer data (%s)", e)
         return None
+
+    # Construct the description from appointment details
+    service_notes = appointment.get('serviceNotes')
+    if not service_notes or not isinstance(service_notes, str):
+        service_notes = 'No Additional Notes'
+    notes_head, _, _ = service_notes.partition('TeamsMeetingSeparator')
+    notes = notes_head.strip()
+    description = DESCRIPTION_TEMPLATE.format_map(dict(customer_details, notes=notes))
+
+    # Extract staff member ID from the appointment
+    staff_member_ids = appointment.get('staffMemberIds')
+    staff_member_id = staff_member_ids[0] if isinstance(staff_member_ids, list) and staff_member_ids else None
+
+    agent_id = None
+    if isinstance(staff_member_id, str) and staff_member_id:
+        # Map staff member ID to agent ID in BOSSDesk
+        agent_id = map_staff_id_to_agent_id(staff_member_id)
+    else:
+        logger.warning("No staff member ID found in the appointment")
+
+    # Extracting username from employee's email, unless the question went unanswered
+    employee_email = customer_details['employee_email']
+    employee_username = extract_username_from_email(employee_email) if employee_email != 'Not Provided' else None
+
+    # Fetch requester_id based on employee email
+    requester_id = None
+    if employee_username:
+        employee_email = employee_email.lower()
+        if requester_ids is not None and employee_email in requester_ids:
+            requester_id = requester_ids[employee_email]
+        else:
+            requester_id = find_user_id(employee_username)
+        if not requester_id:
+            logger.warning("Could not find requester_id for username: %s", employee_username)
     else:
-        return service_request
+        logger.warning("Employee username could not be extracted from email")
+
+    # Contructing the service request with the new requester ID
+    ticket = _TICKET_TEMPLATE.copy()
+    ticket.update(
+        title=appointment.get('serviceName'),
+        description=description,
+        custom_fields={'75': appointment.get('id')},  # Microsoft Bookings appointment ID
+        agent_id=agent_id,
+        requester_id=requester_id
+    )
+    return {'ticket': ticket}
+
+
+# Bounds of the adaptive delay between polling iterations, at least a second so the scheduling arithmetic stays defined
+POLL_MIN_SECONDS = max(1, int(os.getenv('POLL_MIN_SECONDS', '30')))
+POLL_MAX_SECONDS = max(POLL_MIN_SECONDS, int(os.getenv('POLL_MAX_SECONDS', '1800')))
+
+# Number of idle iterations in a row after which the delay doubles
+POLL_IDLE_ITERATIONS = max(1, int(os.getenv('POLL_IDLE_ITERATIONS', '1')))
+
+# Polls quickly while appointments keep arriving and doubles the delay for every POLL_IDLE_ITERATIONS idle iterations in a row
+def next_poll_delay(idle_streak):
+    return min(POLL_MAX_SECONDS, POLL_MIN_SECONDS * 2 ** (idle_streak // POLL_IDLE_ITERATIONS))
 
 
 # Main integration logic
 def main():
     iteration_count = 0
+    idle_streak = 0
+    force_reconcile = False
     while True:
         iteration_count += 1
+        iteration_started = time.monotonic()
+        created = 0
         try:
-            logger.info(f"Starting iteration {iteration_count} of integration logic")
+            logger.info("Starting iteration %s of integration logic", iteration_count)
+
+            # Reconcile the local record with BOSSDesk on the first iteration and then every RECONCILE_EVERY iterations,
+            # to pick up tickets created outside this script. The listing runs alongside the appointment fetch.
+            reconcile = force_reconcile or (iteration_count - 1) % RECONCILE_EVERY == 0
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                reconcile_future = executor.submit(reconcile_seen_appointments) if reconcile else None
+                appointments_future = executor.submit(get_new_appointments)
+                reconciled = reconcile_future.result() if reconcile_future else True
+                new_appointments = appointments_future.result()
+            logger.info("Retrieved %s new appointments", len(new_appointments))
+
+            # Appointments left over from earlier iterations are retried alongside the new ones, with the fresher copy winning
+            pending_appointments = load_pending_appointments()
+            if pending_appointments:
+                logger.info("Retrying %s appointments from earlier iterations", len(pending_appointments))
+                appointments_by_id = {appointment['id']: appointment for appointment in pending_appointments}
+                appointments_by_id.update((appointment['id'], appointment) for appointment in new_appointments)
+                new_appointments = list(appointments_by_id.values())
+
+            failed_ids = set()
+            if not reconciled and load_last_reconciled() is None:
+                # Without a single successful listing the local record cannot tell which appointments already have tickets
+                logger.warning("BOSSDesk tickets have never been listed successfully, deferring ticket creation to avoid duplicates")
+                save_pending_appointments(new_appointments)
+            else:
+                to_create = [appointment for appointment in new_appointments if appointment['id'] not in SEEN_APPOINTMENT_IDS]
+                logger.info("%s/%s appointments need tickets", len(to_create), len(new_appointments))
 
-            # Fetch existing booking IDs to check against new appointments
-            existing_appointment_ids = get_existing_tickets()
+                if to_create:
+                    # Resolve every requester in one user search instead of one lookup per appointment
+                    requester_ids = fetch_users_by_emails(collect_employee_emails(to_create))
+                    created, failed_ids = create_service_requests_bulk(to_create, requester_ids)
+                    save_pending_appointments([appointment for appointment in to_create if appointment['id'] in failed_ids])
 
-            new_appointments = get_new_appointments()
-            logger.info(f"Retrieved {len(new_appointments)} new appointments")
+            # Every appointment of this poll now has a ticket, is pending a retry or could not be mapped,
+            # so the delta sync and the full-collection cutoff always move forward
+            save_delta_link()
+            save_last_polled()
 
-            for index, appointment in enumerate(new_appointments, start=1):
-                if appointment['id'] not in existing_appointment_ids:
-                    logger.info(f"Creating service request for new appointment {index} of {len(new_appointments)}")
-                    create_service_request(appointment)
-                else:
-                    logger.info(f"Appointment {index} already has a service request")
+            # A failed create may still have reached BOSSDesk, so check its tickets before retrying.
+            # A failed reconciliation is retried on the next iteration as well.
+            force_reconcile = bool(failed_ids) or not reconciled
         except Exception as e:
-            logger.error(f"Unexpected error in main function during iteration {iteration_count}: {e}")
+            logger.error("Unexpected error in main function during iteration %s: %s", iteration_count, e)
+            force_reconcile = True
         finally:
-            logger.info(f"Ending iteration {iteration_count} of integration logic")
+            logger.info("Ending iteration %s of integration logic", iteration_count)
 
-        time.sleep(300)  # Introduces a 5-minute delay between iterations
+        # The delay is measured from the start of the iteration, so slow iterations don't stretch the polling cadence
+        # Only tickets actually created count as activity, so an appointment that keeps failing lets the delay back off
+        idle_streak = 0 if created else idle_streak + 1
+        delay = next_poll_delay(idle_streak)
+        elapsed = time.monotonic() - iteration_started
+        remaining = delay - elapsed
+        if remaining < 0:
+            # An overrunning iteration does not trigger an immediate catch-up run; the next one waits for the following slot
+            logger.warning("Iteration %s took %.0f seconds, longer than the %s second polling interval", iteration_count, elapsed, delay)
+            remaining = delay - elapsed % delay
+        logger.info("Next iteration in %.0f seconds", remaining)
+        time.sleep(remaining)
 
 if __name__ == "__main__":
     main()